@@ -3,53 +3,61 @@
 Test script to check the /start endpoint
 """
 
-import requests
-import json
+import asyncio
+import httpx
 
-def test_start_endpoint():
+# Connection limits shared by all endpoint tests; keeping one AsyncClient
+# open across the calls lets the second request reuse the first socket
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+async def test_start_endpoint(client):
     url = "http://localhost:8000/start"
-    
+
     # Test data
     data = {
         "video_filename": "video_20250703_122435.mp4"
     }
-    
+
     print(f"Testing /start endpoint with data: {data}")
-    
+
     try:
-        response = requests.post(url, json=data)
+        response = await client.post(url, json=data)
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
-        
+
         if response.status_code == 200:
             print("✓ Start endpoint working correctly")
         else:
             print(f"✗ Start endpoint failed with status {response.status_code}")
-            
+
     except Exception as e:
         print(f"✗ Error testing start endpoint: {e}")
 
-def test_videos_endpoint():
+async def test_videos_endpoint(client):
     url = "http://localhost:8000/videos"
-    
+
     print(f"Testing /videos endpoint")
-    
+
     try:
-        response = requests.get(url)
+        response = await client.get(url)
         print(f"Status Code: {response.status_code}")
         data = response.json()
         print(f"Videos found: {len(data['videos'])}")
-        
+
         for video in data['videos']:
             print(f"  - {video['filename']} ({video['size_mb']} MB)")
-            
+
     except Exception as e:
         print(f"✗ Error testing videos endpoint: {e}")
 
+async def main():
+    async with httpx.AsyncClient(limits=LIMITS, timeout=30.0) as client:
+        await test_videos_endpoint(client)
+        print()
+        await test_start_endpoint(client)
+
 if __name__ == "__main__":
     print("Testing Vehicle Detection API Endpoints")
     print("=" * 50)
-    
-    test_videos_endpoint()
-    print()
-    test_start_endpoint()
+
+    asyncio.run(main())
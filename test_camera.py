@@ -4,23 +4,35 @@ Camera Test Script
 Run this to diagnose camera issues
 """
 
+import sys
+
 import cv2
 import numpy as np
 
+# FOURCC codes are literal bit-packings (ord(c0) | ord(c1)<<8 | ...), so
+# compute them once at import instead of calling cv2.VideoWriter_fourcc
+# per codec on every diagnostic run
+FOURCC = {c: ord(c[0]) | (ord(c[1]) << 8) | (ord(c[2]) << 16) | (ord(c[3]) << 24)
+          for c in ('XVID', 'MJPG', 'mp4v', 'H264')}
+
 def test_camera_access():
     """Test camera access with different backends"""
     
     print("Testing camera access...")
     print("=" * 50)
     
-    # Test different backends
-    backends = [
-        (cv2.CAP_DSHOW, "DirectShow (Windows)"),
-        (cv2.CAP_MSMF, "Media Foundation (Windows)"),
-        (cv2.CAP_V4L2, "Video4Linux2 (Linux)"),
+    # Probe only the backends that exist on this OS (each VideoCapture
+    # construction is a heavyweight driver probe), then fall back to ANY
+    platform_backends = {
+        'win32': [(cv2.CAP_DSHOW, "DirectShow (Windows)"),
+                  (cv2.CAP_MSMF, "Media Foundation (Windows)")],
+        'linux': [(cv2.CAP_V4L2, "Video4Linux2 (Linux)")],
+        'darwin': [(cv2.CAP_AVFOUNDATION, "AVFoundation (macOS)")],
+    }
+    backends = platform_backends.get(sys.platform, []) + [
         (cv2.CAP_ANY, "Any available backend")
     ]
-    
+
     available_cameras = []
     
     for camera_idx in range(5):  # Test cameras 0-4
@@ -48,6 +60,9 @@ def test_camera_access():
                                 break
                         else:
                             print(f"    ✓ Successfully read 3 frames")
+                        # First working backend is enough for this index
+                        cap.release()
+                        break
                     else:
                         print(f"  ✗ {backend_name}: Opens but no frames")
                 else:
@@ -88,10 +103,8 @@ def test_opencv_installation():
         print(f"OpenCV version: {cv2.__version__}")
         
         # Test video codecs
-        fourcc_codes = ['XVID', 'MJPG', 'mp4v', 'H264']
         print("\nSupported video codecs:")
-        for codec in fourcc_codes:
-            fourcc = cv2.VideoWriter_fourcc(*codec)
+        for codec, fourcc in FOURCC.items():
             print(f"  {codec}: {fourcc}")
         
         # Test camera backends
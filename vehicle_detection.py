@@ -1,90 +1,124 @@
 
+import sys
+
 import cv2
 import numpy as np
+from numba import njit
 from ultralytics import YOLO
-from collections import defaultdict
 import time
 
+@njit(cache=True)
+def _update_counts(slots, curr_ys, prev_ys, has_prev, line, counted):
+    """Counting-line crossing check over one frame's detections.
+
+    Compiled to machine code so the per-detection compare/branch work
+    runs without interpreter dispatch. Marks newly counted slots in the
+    `counted` mask in place and returns the (in, out) deltas.
+    """
+    in_delta = 0
+    out_delta = 0
+    for i in range(slots.shape[0]):
+        if not has_prev[i] or counted[slots[i]]:
+            continue
+        if prev_ys[i] < line < curr_ys[i]:
+            in_delta += 1
+            counted[slots[i]] = 1
+        elif prev_ys[i] > line > curr_ys[i]:
+            out_delta += 1
+            counted[slots[i]] = 1
+    return in_delta, out_delta
+
 class VehicleDetectionSystem:
+    MAX_TRACK_IDS = 4096   # track ids index the history arrays modulo this
+    HISTORY_LEN = 30       # center points kept per track
+
     def __init__(self, model_path='yolov8n.pt', confidence=0.5):
         # Initialize YOLO model
         self.model = YOLO(model_path)
         self.confidence = confidence
         
         # Vehicle classes in COCO dataset
-        self.vehicle_classes = [2, 3, 5, 7]  # car, motorcycle, bus, truck
+        self.vehicle_classes = np.array([2, 3, 5, 7])  # car, motorcycle, bus, truck
         
-        # Tracking
-        self.track_history = defaultdict(lambda: [])
+        # Tracking: fixed-size ring buffers in preallocated arrays
+        # (same layout as the API pipeline) — O(1) appends instead of
+        # list.pop(0), no per-frame tuple churn, bounded memory
+        self.history = np.zeros((self.MAX_TRACK_IDS, self.HISTORY_LEN, 2), np.int32)
+        self.hist_head = np.zeros(self.MAX_TRACK_IDS, np.int32)
+        self.hist_len = np.zeros(self.MAX_TRACK_IDS, np.int32)
         self.vehicle_count = {'in': 0, 'out': 0, 'total': 0}
-        self.counted_ids = set()
+        self.counted_mask = np.zeros(self.MAX_TRACK_IDS, np.uint8)
         
         # Counting line position (horizontal line at middle of frame)
         self.counting_line = None
+        self._line_p1 = None
+        self._line_p2 = None
         
-    def setup_counting_line(self, frame_height, position=0.5):
-        """Setup counting line position"""
-        self.counting_line = int(frame_height * position)
-        
+    def setup_counting_line(self, frame_shape, position=0.5):
+        """Setup counting line position and cache its draw endpoints"""
+        height, width = frame_shape[:2]
+        self.counting_line = int(height * position)
+        self._line_p1 = (0, self.counting_line)
+        self._line_p2 = (width - 1, self.counting_line)
+
+    def _history_append(self, track_id, center_x, center_y):
+        """Record a track's latest center point (O(1) ring-buffer write)"""
+        slot = track_id % self.MAX_TRACK_IDS
+        self.history[slot, self.hist_head[slot]] = (center_x, center_y)
+        self.hist_head[slot] = (self.hist_head[slot] + 1) % self.HISTORY_LEN
+        self.hist_len[slot] = min(self.hist_len[slot] + 1, self.HISTORY_LEN)
+
     def process_frame(self, frame):
         """Process single frame for detection and counting"""
         # Run detection
         results = self.model.track(frame, persist=True, conf=self.confidence)
         
-        # Initialize annotated frame
-        annotated_frame = frame.copy()
-        
         if results[0].boxes is not None and results[0].boxes.id is not None:
             boxes = results[0].boxes.xyxy.cpu().numpy()
             track_ids = results[0].boxes.id.cpu().numpy().astype(int)
             classes = results[0].boxes.cls.cpu().numpy().astype(int)
-            
-            for box, track_id, cls in zip(boxes, track_ids, classes):
-                # Filter only vehicle classes
-                if cls not in self.vehicle_classes:
-                    continue
-                
-                x1, y1, x2, y2 = box.astype(int)
-                center_y = int((y1 + y2) / 2)
-                
+
+            # Filter to vehicle classes and compute all box centers in
+            # one vectorized pass instead of per-detection arithmetic
+            vehicle_mask = np.isin(classes, self.vehicle_classes)
+            boxes = boxes[vehicle_mask].astype(np.int32)
+            track_ids = track_ids[vehicle_mask]
+            slots = track_ids % self.MAX_TRACK_IDS
+            center_xs = (boxes[:, 0] + boxes[:, 2]) // 2
+            center_ys = (boxes[:, 1] + boxes[:, 3]) // 2
+
+            for (x1, y1, x2, y2), track_id, center_x, center_y in zip(
+                    boxes, track_ids, center_xs, center_ys):
                 # Update tracking history
-                self.track_history[track_id].append((int((x1 + x2) / 2), center_y))
-                
-                # Keep only last 30 points
-                if len(self.track_history[track_id]) > 30:
-                    self.track_history[track_id].pop(0)
+                self._history_append(track_id, center_x, center_y)
                 
                 # Draw bounding box
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(annotated_frame, f'ID: {track_id}', (x1, y1 - 10),
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.putText(frame, f'ID: {track_id}', (x1, y1 - 10),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                
-                # Check if vehicle crosses counting line
-                if self.counting_line and track_id not in self.counted_ids:
-                    if len(self.track_history[track_id]) > 10:
-                        # Get previous and current y positions
-                        prev_y = self.track_history[track_id][-10][1]
-                        curr_y = center_y
-                        
-                        # Check crossing
-                        if prev_y < self.counting_line < curr_y:
-                            self.vehicle_count['in'] += 1
-                            self.vehicle_count['total'] += 1
-                            self.counted_ids.add(track_id)
-                        elif prev_y > self.counting_line > curr_y:
-                            self.vehicle_count['out'] += 1
-                            self.vehicle_count['total'] += 1
-                            self.counted_ids.add(track_id)
+            
+            # Run the crossing check as one compiled pass: gather each
+            # track's y-center from 10 points ago, then let the numba
+            # kernel update the counts
+            if self.counting_line and len(slots):
+                prev_ys = self.history[
+                    slots, (self.hist_head[slots] - 10) % self.HISTORY_LEN, 1]
+                has_prev = self.hist_len[slots] > 10
+                in_delta, out_delta = _update_counts(
+                    slots, center_ys, prev_ys, has_prev,
+                    self.counting_line, self.counted_mask)
+                self.vehicle_count['in'] += in_delta
+                self.vehicle_count['out'] += out_delta
+                self.vehicle_count['total'] += in_delta + out_delta
         
         # Draw counting line
         if self.counting_line:
-            cv2.line(annotated_frame, (0, self.counting_line), 
-                    (frame.shape[1], self.counting_line), (0, 0, 255), 2)
+            cv2.line(frame, self._line_p1, self._line_p2, (0, 0, 255), 2)
         
         # Display counts
-        self._draw_info(annotated_frame)
+        self._draw_info(frame)
         
-        return annotated_frame
+        return frame
     
     def _draw_info(self, frame):
         """Draw counting information on frame"""
@@ -105,15 +139,24 @@ class VehicleDetectionSystem:
     
     def run_camera(self, source=0):
         """Run detection on camera feed"""
-        cap = cv2.VideoCapture(source)
-        
+        # Pin the platform backend so OpenCV doesn't probe through
+        # GStreamer first, and ask the camera for MJPG: UVC cameras
+        # encode JPEG in hardware, which spares the driver its
+        # per-frame YUYV->BGR conversion
+        backend = cv2.CAP_V4L2 if sys.platform.startswith('linux') else cv2.CAP_ANY
+        cap = cv2.VideoCapture(source, backend)
+
         if not cap.isOpened():
             raise ValueError("Cannot open camera")
+
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
         
         # Get frame dimensions
         ret, frame = cap.read()
         if ret:
-            self.setup_counting_line(frame.shape[0])
+            self.setup_counting_line(frame.shape)
         
         prev_time = time.time()
         self.fps = 0
@@ -158,7 +201,7 @@ class VehicleDetectionSystem:
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         
-        self.setup_counting_line(height)
+        self.setup_counting_line((height, width))
         
         # Setup video writer for output
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -196,8 +239,9 @@ class VehicleDetectionSystem:
     def reset_counts(self):
         """Reset all counts and tracking"""
         self.vehicle_count = {'in': 0, 'out': 0, 'total': 0}
-        self.counted_ids.clear()
-        self.track_history.clear()
+        self.counted_mask.fill(0)
+        self.hist_head.fill(0)
+        self.hist_len.fill(0)
         print("Counts reset!")
 
 # Main execution